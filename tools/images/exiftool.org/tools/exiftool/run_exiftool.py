@@ -1,63 +1,151 @@
 import sys
-import json
 import os
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+# prefer orjson for faster (de)serialization but fall back to the stdlib
+try:
+    import orjson
+
+    dumps = orjson.dumps
+    loads = orjson.loads
+except ImportError:
+    import json
+
+    def dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+
+    loads = json.loads
+
+
+# result keys that are uploaded as tags
+tag_keys = ("FileType", "FileTypeExtension", "FileSize", "PEType", "MachineType", "EntryPoint", "MIMEType")
+# result keys we don't want to appear in results
+exclude_keys = frozenset({
+    "Directory",
+    "FileName",
+    "FilePermissions",
+    "SourceFile",
+    "FileModifyDate",
+    "FileAccessDate",
+    "FileInodeChangeDate"})
 
 # extract tags from results if they exist
 def extractTags(result):
     tags = {}
-    keys = ["FileType", "FileTypeExtension", "FileSize", "PEType", "MachineType", "EntryPoint", "MIMEType"]
+    if not result:
+        return tags
 
-    for k in keys:
-        if (result and k in result):
-            if len(result[k]) > 0:
-                tags[k] = result[k]
+    for k in tag_keys:
+        if k in result and len(result[k]) > 0:
+            tags[k] = result[k]
 
     return tags
 
+# strip unwanted keys from an ExifTool result and pull out its tags
+def processResult(result):
+    # cleanup only the excluded keys this result actually has
+    for result_key in exclude_keys & result.keys():
+        del result[result_key]
+
+    tags = extractTags(result)
+
+    # return results dict
+    return {'results': result, 'tags': tags}
+
 def run(file_path):
     # run exiftool tool on sample
     cmd = ['./exiftool/exiftool', '-j', '-b', '-api', 'timezone=UTC', file_path]
+    # stderr goes straight to our logs so only stdout needs to be read
     proc = subprocess.Popen(cmd,
                             shell=False,
-                            stdout=subprocess.PIPE,
-                            stderr=subprocess.PIPE)
-    out, err = proc.communicate()
-    errcode = proc.returncode
+                            bufsize=1 << 20,
+                            stdout=subprocess.PIPE)
+    out = proc.stdout.read()
+    errcode = proc.wait()
     # process ExifTool results
     decout = out.decode("utf-8", errors="replace")
 
     # get first element returned by ExifTool
-    result = json.loads(decout)[0]
-
-    # cleanup keys we don't want to appear in results
-    exclude_keys = \
-        ["Directory",
-        "FileName",
-        "FilePermissions",
-        "SourceFile",
-        "FileModifyDate",
-        "FileAccessDate"
-        "FileInodeChangeDate"]
-    for result_key in exclude_keys:
-        result.pop(result_key, None) 
+    result = loads(decout)[0]
 
-    tags = extractTags(result)
+    return processResult(result)
 
-    # return results dict
-    return {'results': result, 'tags': tags}
+def runChunk(file_paths):
+    # run exiftool once for all samples, it returns one JSON element per file
+    cmd = ['./exiftool/exiftool', '-j', '-b', '-api', 'timezone=UTC', *file_paths]
+    # stderr goes straight to our logs so only stdout needs to be read
+    proc = subprocess.Popen(cmd,
+                            shell=False,
+                            bufsize=1 << 20,
+                            stdout=subprocess.PIPE)
+    out = proc.stdout.read()
+    errcode = proc.wait()
+    # process ExifTool results
+    decout = out.decode("utf-8", errors="replace")
+
+    # split results back out by sample path before SourceFile is excluded
+    outputs = {}
+    for result in loads(decout):
+        file_path = result.get("SourceFile")
+        outputs[file_path] = processResult(result)
+    return outputs
+
+def runBatch(file_paths):
+    if len(file_paths) == 0:
+        return {}
+    # exiftool handles the files it is given serially so split them across one call per core
+    workers = min(os.cpu_count() or 1, len(file_paths))
+    chunks = [file_paths[i::workers] for i in range(workers)]
+    outputs = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for chunk_outputs in executor.map(runChunk, chunks):
+            outputs.update(chunk_outputs)
+    return outputs
 
-# the path to the sample is taken as an input
-if len(sys.argv) == 1:
-    output = {'results': {"Errors": [f"No sample path provided"]}}
-else:
-    output = run(sys.argv[1])
+# merge the tags of every sample into one list of unique values per tag
+def mergeTags(outputs):
+    merged = {}
+    for output in outputs:
+        for key, value in output['tags'].items():
+            values = merged.setdefault(key, {})
+            # the agent doesn't accept nested lists so flatten any list values
+            for item in (value if isinstance(value, list) else [value]):
+                values[item] = None
+    return {key: list(values) for key, values in merged.items()}
 
-# write tool results to thorium results path
-with open("/tmp/thorium/results", "w") as f:
-    f.write(json.dumps(output['results']))
+# expand any sample directories into the files they contain
+def collectPaths(paths):
+    file_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            with os.scandir(path) as entries:
+                file_paths.extend(sorted(entry.path for entry in entries if entry.is_file()))
+        else:
+            file_paths.append(path)
+    return file_paths
+
+if __name__ == "__main__":
+    # the path to the sample is taken as an input, pass --batch first to scan several samples or directories of samples at once
+    batch = sys.argv[1:2] == ["--batch"]
+    file_paths = sys.argv[2:] if batch else sys.argv[1:2]
+    if len(file_paths) == 0:
+        output = {'results': {"Errors": [f"No sample path provided"]}}
+    elif batch:
+        # batch results are keyed by sample path but the tags file has to stay flat for the agent
+        outputs = runBatch(collectPaths(file_paths))
+        output = {
+            'results': {path: out['results'] for path, out in outputs.items()},
+            'tags': mergeTags(outputs.values()),
+        }
+    else:
+        output = run(sys.argv[1])
 
-if 'tags' in output and output['tags'] != {}:
     # write tool results to thorium results path
-    with open("/tmp/thorium/tags", "w") as f:
-        f.write(json.dumps(output['tags']))
+    with open("/tmp/thorium/results", "wb") as f:
+        f.write(dumps(output['results']))
+
+    if 'tags' in output and output['tags'] != {}:
+        # write tool results to thorium results path
+        with open("/tmp/thorium/tags", "wb") as f:
+            f.write(dumps(output['tags']))
@@ -1,16 +1,133 @@
 import sys
-import json
 import os
+import socket
+import struct
 import subprocess
 import re
+from concurrent.futures import ThreadPoolExecutor
 
-def run(file_path):
+# prefer orjson for faster serialization but fall back to the stdlib
+try:
+    import orjson
+
+    dumps = orjson.dumps
+except ImportError:
+    import json
+
+    def dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+
+
+# matches the signature clamscan prints for a sample with a finding
+found_regex = re.compile(rb"[^:]+: (.+) FOUND")
+# matches the per file lines clamscan prints when scanning multiple samples
+batch_regex = re.compile(rb"^(.+): (.+) (FOUND|ERROR)$", re.MULTILINE)
+
+# clamd keeps the signature database loaded between scans, it can be reached
+# over a unix socket path or a host:port address. The image doesn't run clamd
+# itself so this is only used when a clamd is reachable at CLAMD_ADDRESS
+clamd_address = os.environ.get("CLAMD_ADDRESS", "/var/run/clamav/clamd.ctl")
+# the size of the chunks samples are streamed to clamd in
+clamd_chunk_size = 1 << 20
+# the clamav version is only looked up once
+clamav_version = None
+
+def clamd_connect():
+    # returns a socket connected to clamd or None if clamd is not reachable
+    try:
+        if clamd_address.startswith('/'):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(clamd_address)
+            return sock
+        host, port = clamd_address.rsplit(':', 1)
+        return socket.create_connection((host, int(port)))
+    except (OSError, ValueError):
+        return None
+
+def clamd_reply(sock):
+    # clamd replies are terminated by a null byte in z mode
+    reply = b''
+    while not reply.endswith(b'\0'):
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        reply += chunk
+    return reply.rstrip(b'\0').decode('utf-8', errors='replace')
+
+def clamd_scan(file_path):
+    # scan a sample with clamd, returning None if clamscan should scan it instead
+    sock = clamd_connect()
+    if sock is None:
+        return None
+    try:
+        with sock:
+            # stream the sample to clamd so it doesn't need access to our filesystem
+            sock.sendall(b'zINSTREAM\0')
+            with open(file_path, 'rb') as f:
+                while chunk := f.read(clamd_chunk_size):
+                    sock.sendall(struct.pack('!L', len(chunk)) + chunk)
+            sock.sendall(struct.pack('!L', 0))
+            reply = clamd_reply(sock)
+    except OSError:
+        # clamd drops the connection once a sample passes its StreamMaxLength
+        return None
+
+    # replies look like "stream: <signature> FOUND", "stream: OK" or "<error> ERROR"
+    if reply.endswith(' FOUND'):
+        return build_output(reply[len('stream: '):-len(' FOUND')].strip(), '', 1, get_version())
+    if reply.endswith(' OK'):
+        return build_output(None, '', 0, get_version())
+    # errors like "INSTREAM size limit exceeded" are clamd's limits and not the sample's
+    return None
+
+def get_version():
+    global clamav_version
+    if clamav_version is not None:
+        return clamav_version
+    # get clamav version from clamd if its running
+    sock = clamd_connect()
+    if sock is not None:
+        try:
+            with sock:
+                sock.sendall(b'zVERSION\0')
+                clamav_version = clamd_reply(sock)
+            return clamav_version
+        except OSError:
+            # ask clamscan instead if clamd went away
+            pass
     # get clamav version
     cmd = ['clamscan', '--version']
-    clamav_version = subprocess.Popen(cmd,
-                                      shell=False,
-                                      stdout=subprocess.PIPE).communicate()[0]
-    clamav_version = clamav_version.rstrip().decode('utf-8')
+    version = subprocess.Popen(cmd,
+                               shell=False,
+                               stdout=subprocess.PIPE).communicate()[0]
+    clamav_version = version.rstrip().decode('utf-8')
+    return clamav_version
+
+def build_output(clamav_output, err, err_code, clamav_version):
+    # check for errors and upload tags
+    tags = {}
+    if err:
+        # stderr is only decoded when there is an error to report
+        if isinstance(err, bytes):
+            err = err.decode('utf-8')
+        clamav_output = {'Errors': [f"AV Error({err_code}): {err}"], 'Version': clamav_version}
+    # upload tags for findings
+    elif clamav_output != None:
+        tags = {"ClamAV": clamav_output}
+        clamav_output = {"Result": clamav_output, 'Version': clamav_version}
+    else:
+        clamav_output = {"Result": "Ok", 'Version': clamav_version}
+
+    # return results dict
+    return {'results': clamav_output, 'tags': tags}
+
+def run(file_path):
+    # prefer scanning with clamd and fall back to clamscan when its not running
+    output = clamd_scan(file_path)
+    if output is not None:
+        return output
+
+    clamav_version = get_version()
 
     # run clamav tool on sample
     cmd = ['clamscan', '--no-summary', file_path]
@@ -21,36 +138,97 @@ def run(file_path):
     out, err = proc.communicate()
     err_code = proc.returncode
 
-    clamav_output = re.search(r"{}".format("[^:]+: (.+) FOUND"), out.decode('utf-8'))
+    # search the raw output and only decode the matched signature
+    clamav_output = found_regex.search(out)
 
     if (clamav_output != None):
-        clamav_output = clamav_output.group(1).lstrip().rstrip()
+        clamav_output = clamav_output.group(1).strip().decode('utf-8')
 
-    # check for errors and upload tags
-    tags = {}
-    if err.decode('utf-8') != '':
-        clamav_output = {'Errors': [f"AV Error({err_code}): {err.decode('utf-8')}"], 'Version': clamav_version}
-    # upload tags for findings
-    elif clamav_output != None:
-        tags = {"ClamAV": clamav_output}
-        clamav_output = {"Result": clamav_output, 'Version': clamav_version}
-    else:
-        clamav_output = {"Result": "Ok", 'Version': clamav_version}
+    return build_output(clamav_output, err, err_code, clamav_version)
 
-    # return results dict
-    return {'results': clamav_output, 'tags': tags}
+def run_batch(file_paths):
+    # clamd scans samples concurrently so stream each sample on its own connection
+    sock = clamd_connect()
+    if sock is not None:
+        sock.close()
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            return dict(zip(file_paths, executor.map(run, file_paths)))
+
+    clamav_version = get_version()
 
-# the path to the sample is taken as an input
-if len(sys.argv) == 1:
-    output = {'results': {"Errors": [f"No sample path provided"]}}
-else:
-    output = run(sys.argv[1])
+    # scan all samples with a single clamscan so the signature database is only loaded once
+    cmd = ['clamscan', '--no-summary', *file_paths]
+    proc = subprocess.Popen(cmd,
+                            shell=False,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+    out, err = proc.communicate()
+
+    # split the findings and per file errors back out by sample path
+    findings = {}
+    errors = {}
+    for match in batch_regex.finditer(out):
+        path, value, status = match.groups()
+        path = path.decode('utf-8')
+        if status == b"FOUND":
+            findings[path] = value.strip().decode('utf-8')
+        else:
+            errors[path] = value.strip().decode('utf-8')
 
-# write tool results to thorium results path
-with open("/tmp/thorium/results", "w") as f:
-    f.write(json.dumps(output['results']))
+    # stderr covers the whole run so log it rather than blaming every sample for it
+    if err:
+        sys.stderr.write(err.decode('utf-8', errors='replace'))
+
+    outputs = {}
+    for file_path in file_paths:
+        # only samples with their own ERROR line are errored, clamscan's code for errors is 2
+        file_err = errors.get(file_path)
+        outputs[file_path] = build_output(findings.get(file_path), file_err, 2, clamav_version)
+    return outputs
+
+# merge the tags of every sample into one list of unique values per tag
+def merge_tags(outputs):
+    merged = {}
+    for output in outputs:
+        for key, value in output['tags'].items():
+            values = merged.setdefault(key, {})
+            # the agent doesn't accept nested lists so flatten any list values
+            for item in (value if isinstance(value, list) else [value]):
+                values[item] = None
+    return {key: list(values) for key, values in merged.items()}
+
+# expand any sample directories into the files they contain
+def collect_paths(paths):
+    file_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            with os.scandir(path) as entries:
+                file_paths.extend(sorted(entry.path for entry in entries if entry.is_file()))
+        else:
+            file_paths.append(path)
+    return file_paths
+
+if __name__ == "__main__":
+    # the path to the sample is taken as an input, pass --batch first to scan several samples or directories of samples at once
+    batch = sys.argv[1:2] == ["--batch"]
+    file_paths = sys.argv[2:] if batch else sys.argv[1:2]
+    if len(file_paths) == 0:
+        output = {'results': {"Errors": [f"No sample path provided"]}}
+    elif batch:
+        # batch results are keyed by sample path but the tags file has to stay flat for the agent
+        outputs = run_batch(collect_paths(file_paths))
+        output = {
+            'results': {path: out['results'] for path, out in outputs.items()},
+            'tags': merge_tags(outputs.values()),
+        }
+    else:
+        output = run(sys.argv[1])
 
-if 'tags' in output and output['tags'] != {}:
     # write tool results to thorium results path
-    with open("/tmp/thorium/tags", "w") as f:
-        f.write(json.dumps(output['tags']))
+    with open("/tmp/thorium/results", "wb") as f:
+        f.write(dumps(output['results']))
+
+    if 'tags' in output and output['tags'] != {}:
+        # write tool results to thorium results path
+        with open("/tmp/thorium/tags", "wb") as f:
+            f.write(dumps(output['tags']))
@@ -1,5 +1,23 @@
-import json
 import argparse
+import csv
+import io
+from collections import defaultdict
+
+# prefer orjson for faster (de)serialization but fall back to the stdlib
+try:
+  import orjson
+
+  def dumps(obj, indent=False):
+    return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+
+  loads = orjson.loads
+except ImportError:
+  import json
+
+  def dumps(obj, indent=False):
+    return json.dumps(obj, indent=2 if indent else None).encode('utf-8')
+
+  loads = json.loads
 
 parser = argparse.ArgumentParser("Summarize Suricata Logs")
 parser.add_argument("--logs", help="Path to Suricata logs directory", default="/tmp/thorium/result-files")
@@ -9,32 +27,29 @@ parser.add_argument("--tags", help="Path to file to dump Thorium tags", default=
 args = parser.parse_args()
 
 def parse_event_logs(path):
-  alerts = []
-  alert_summary = {}
+  alert_summary = defaultdict(lambda: {"count": 0, "signature": None, "severity": None, "timestamps": []})
   stats = {}
 
-  with open(path) as file:
+  # read eve.json as bytes with a large buffer so lines are never decoded to str
+  with open(path, 'rb', buffering=1 << 20) as file:
     for line in file:
-      event = json.loads(line)
-      if "event_type" in event:
-        event_type = event["event_type"]
-        if event_type == "alert":
-            alerts.append(event)
-            sig_id = event['alert']['signature_id']
-            signature = event['alert']['signature']
-            severity = event['alert']['severity']
-            timestamp = event['timestamp']
-            if sig_id in alert_summary:
-              alert_summary[sig_id]['count'] += 1
-              alert_summary[sig_id]['timestamps'].append(timestamp)
-              #print(f"Saving duplicate alert: {event}") 
-            else:
-              alert_summary[sig_id] = {"count": 1, "signature": signature, "severity": severity, "timestamps": [timestamp]}
-              #print(f"Saving new alert: {event}") 
-        elif event_type == "stats":
-            stats = event
-            #print(f"Saving stats for pcap: {event}")
-  return (alert_summary, stats)
+      # only alert and stats events are summarized so skip parsing anything else
+      if b'"alert"' not in line and b'"stats"' not in line:
+        continue
+      event = loads(line)
+      event_type = event.get("event_type")
+      if event_type == "alert":
+        alert = event['alert']
+        entry = alert_summary[alert['signature_id']]
+        entry['count'] += 1
+        entry['timestamps'].append(event['timestamp'])
+        # the first alert for a signature sets its signature and severity
+        if entry['signature'] is None:
+          entry['signature'] = alert['signature']
+          entry['severity'] = alert['severity']
+      elif event_type == "stats":
+        stats = event
+  return (dict(alert_summary), stats)
 
 def summarize_alerts(alert_summary):
   return sorted(alert_summary.items(), key=lambda item: (item[1]['severity'], -item[1]['count']))
@@ -46,23 +61,25 @@ def dump_tags(alert_symmary):
   return {"SuricataAlert": alerts}
 
 def dump_table(sorted_alert_summary):
-  table = "Signature ID,Signature,Severity,Count,Timestamps\n"
-
-  for (sig_id, sig_info) in sorted_alert_summary:
-    table += f"{sig_id},{sig_info['signature']},{sig_info['severity']},{sig_info['count']},{sig_info['timestamps']}\n" 
-  return table
+  # buffer the rows and let csv quote any signatures containing commas
+  table = io.StringIO()
+  writer = csv.writer(table, lineterminator="\n")
+  writer.writerow(["Signature ID", "Signature", "Severity", "Count", "Timestamps"])
+  writer.writerows((sig_id, sig_info['signature'], sig_info['severity'], sig_info['count'], sig_info['timestamps'])
+                   for (sig_id, sig_info) in sorted_alert_summary)
+  return table.getvalue()
 
 alert_summary, stats = parse_event_logs(f"{args.logs}/eve.json")
 sorted_alert_summary = summarize_alerts(alert_summary)
 alert_table = dump_table(sorted_alert_summary)
 tags = dump_tags(alert_summary)
 
-with open(args.tags, 'w') as f:
-  f.write(json.dumps(tags, indent=4))
-with open(f"{args.result_files}/alert_summary.json", 'w') as f:
-  f.write(json.dumps(sorted_alert_summary, indent=4))
-with open(args.results, 'w') as f:
-  f.write("### Suricata Alerts\n")
-  f.write(alert_table)
-  # drop stats csv table into results
-  f.write("\n### PCAP Stats\n")
+# tags are only read by Thorium so skip pretty printing them
+with open(args.tags, "wb") as f:
+  f.write(dumps(tags))
+with open(f"{args.result_files}/alert_summary.json", "wb") as f:
+  f.write(dumps(sorted_alert_summary, indent=True))
+# the stats csv table is appended to the results after the alert table
+results = f"### Suricata Alerts\n{alert_table}\n### PCAP Stats\n"
+with open(args.results, "wb") as f:
+  f.write(results.encode('utf-8'))
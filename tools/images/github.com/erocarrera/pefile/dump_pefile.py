@@ -1,33 +1,67 @@
 import argparse
-import json
+import sys
 import pefile
 
-# Recursively check each key and value of a dictionary to ensure it is json serializable
+# prefer orjson for faster serialization but fall back to the stdlib
+try:
+  import orjson
+
+  def dumps(obj):
+    # pefile dumps may contain non-string keys which the stdlib json coerces
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+except ImportError:
+  import json
+
+  def dumps(obj):
+    return json.dumps(obj).encode('utf-8')
+
+# the container and byte types that need to be rebuilt to be json serializable
+SEQUENCE_TYPES = (list, tuple, set)
+BYTES_TYPES = (bytes, bytearray)
+
+# Check each key and value of a dictionary to ensure it is json serializable
+#
+# This walks the dump with an explicit stack instead of recursing so deeply nested
+# resources can't hit the recursion limit and each value is only decoded once
 def decode_dict(raw):
-  fixed = dict()
-  
-  # decode all keys and values of the dictionary
-  if isinstance(raw, dict):
-    for key, value in raw.items():
-      # decode each key within the dictionary
-      if isinstance(key, (bytes, bytearray)):
-        key = key.decode('utf-8')
-      # recursively call decode_dict
-      if isinstance(value, dict):
-        value = decode_dict(value)
-      elif isinstance(value, (list, tuple, set)):
-        value = [decode_dict(member) for member in value]
-      fixed[key] = decode_dict(value)
-    return fixed
-  
-  # call decode_bytes on each member of lists, tuples or sets
-  if isinstance(raw, (list, tuple, set)):
-    return [decode_dict(member) for member in raw]
-  # decode byte or bytearray values
-  elif isinstance(raw, (bytes, bytearray)):
-    return raw.decode('utf-8')
-  # return all other types
-  return raw
+  root = [raw]
+  # each entry is a raw container and the slot in its fixed parent to fill in
+  stack = [(raw, root, 0)]
+  while stack:
+    value, parent, slot = stack.pop()
+    kind = type(value)
+    # decode all keys and values of the dictionary
+    if kind is dict:
+      fixed = {}
+      for key, member in value.items():
+        # decode each key within the dictionary
+        if type(key) in BYTES_TYPES:
+          key = key.decode('utf-8')
+        member_kind = type(member)
+        if member_kind is dict or member_kind in SEQUENCE_TYPES:
+          # reserve the key now so the original key order is kept
+          fixed[key] = None
+          stack.append((member, fixed, key))
+        elif member_kind in BYTES_TYPES:
+          fixed[key] = member.decode('utf-8')
+        else:
+          fixed[key] = member
+      parent[slot] = fixed
+    # convert lists, tuples or sets to lists and decode their members
+    elif kind in SEQUENCE_TYPES:
+      fixed = list(value)
+      for index, member in enumerate(fixed):
+        member_kind = type(member)
+        if member_kind is dict or member_kind in SEQUENCE_TYPES:
+          stack.append((member, fixed, index))
+        elif member_kind in BYTES_TYPES:
+          fixed[index] = member.decode('utf-8')
+      parent[slot] = fixed
+    # decode byte or bytearray values
+    elif kind in BYTES_TYPES:
+      parent[slot] = value.decode('utf-8')
+  # return the fixed root, all other types are returned as is
+  return root[0]
 
 
 def main(infile: str, outfile: str = None, tags: str = None) -> None:
@@ -37,25 +71,33 @@ def main(infile: str, outfile: str = None, tags: str = None) -> None:
  
   # write imphash as a json formated key/value tag pair
   if (tags):
-    with open(tags, 'w') as f:
-      # create imphash thorium tag
-      imphash_tag = {'Imphash': f'{pe.get_imphash()}'}
-      json.dump(imphash_tag, f)
+    # create imphash thorium tag
+    imphash_tag = {'Imphash': f'{pe.get_imphash()}'}
+    with open(tags, "wb") as f:
+      f.write(dumps(imphash_tag))
 
   # decode any byte or bytearray values in the dictionary dump from pefile
   json_dict = decode_dict(pe.dump_dict())
+  # release the mapped sample now that everything has been dumped
+  pe.close()
   
   # put parsing warnings into a key Thorium can see
   if "Parsing Warnings" in json_dict:
     json_dict['Warnings'] = json_dict.pop("Parsing Warnings")
 
+  # serialize straight to bytes and drop the dict so only one copy of the dump is held
+  payload = dumps(json_dict)
+  del json_dict
+
   # dump fixed json to stdout or file depending on kargs
   if (outfile):
     # write json formatted pefile dump 
-    with open(outfile, 'w') as f:
-      json.dump(json_dict, f)
+    with open(outfile, "wb") as f:
+      f.write(payload)
   else:
-    print(json.dumps(json_dict))
+    # write the encoded dump to stdout's buffer to skip text mode encoding
+    sys.stdout.buffer.write(payload)
+    sys.stdout.buffer.write(b'\n')
 
 
 if __name__ == '__main__':
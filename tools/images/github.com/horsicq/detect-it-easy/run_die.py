@@ -1,6 +1,22 @@
+import os
 import sys
-import json
 import subprocess
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+# prefer orjson for faster (de)serialization but fall back to the stdlib
+try:
+    import orjson
+
+    dumps = orjson.dumps
+    loads = orjson.loads
+except ImportError:
+    import json
+
+    def dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+
+    loads = json.loads
 
 
 # pulls the top level tags from the detection results
@@ -32,41 +48,33 @@ def pullValueTags(values):
 
     return tags
 
+# combine two tag dictionaries into one, collecting the values for each key in a list
 def combineTags(tagList1, tagList2):
-    result = {}
+    result = defaultdict(list)
+    for tagList in (tagList1, tagList2):
+        for key, value in tagList.items():
+            result[key].append(value)
 
-    # add tag list 1
-    for key in tagList1:
-        if not key in result:
-            result[key] = [tagList1[key]]
-        else:
-            result[key].append(tagList1[key])
-
-    # add tag list 2
-    for key in tagList2:
-        if not key in result:
-            result[key] = [tagList2[key]]
-        else:
-            result[key].append(tagList2[key])
-        result[key] = tagList2[key]
-
-    return result
+    return dict(result)
 
 def run(file_path):
     # run DetectItEasy tool on sample 
     # | grep -v "TypeError:"
     cmd = ['diec', '-j', file_path]
-    process = subprocess.run(cmd,
-                             text=True,
-                             capture_output=True,
-                             check=True)
+    # stderr goes straight to our logs so only stdout needs to be read
+    process = subprocess.Popen(cmd,
+                               bufsize=1 << 20,
+                               stdout=subprocess.PIPE)
+    out = process.stdout.read()
+    if process.wait() != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd, output=out)
     # process DetectItEasy results
-    resultLines = process.stdout.split("\n")
+    resultLines = out.decode("utf-8").split("\n")
     results = ""
     for line in resultLines:
         if (not line.startswith("[!]")):
             results += line
-    results_json = json.loads(results)
+    results_json = loads(results)
 
     # detections actually returns a list, thus the need for [0]. The actual value is a json
     detections = {}
@@ -86,17 +94,54 @@ def run(file_path):
     # return results dict
     return {'results': results_json, 'tags': detectionTags}
 
-# the path to the sample is taken as an input
-if len(sys.argv) == 1:
-    output = {'results': {"Errors": [f"No sample path provided"]}}
-else:
-    output = run(sys.argv[1])
-
-# write tool results to thorium results path
-with open("/tmp/thorium/results", "w") as f:
-    f.write(json.dumps(output['results']))
+def runBatch(file_paths):
+    # diec can't scan multiple samples in one call so overlap the calls instead
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        return dict(zip(file_paths, executor.map(run, file_paths)))
+
+# merge the tags of every sample into one list of unique values per tag
+def mergeTags(outputs):
+    merged = {}
+    for output in outputs:
+        for key, value in output['tags'].items():
+            values = merged.setdefault(key, {})
+            # the agent doesn't accept nested lists so flatten any list values
+            for item in (value if isinstance(value, list) else [value]):
+                values[item] = None
+    return {key: list(values) for key, values in merged.items()}
+
+# expand any sample directories into the files they contain
+def collectPaths(paths):
+    file_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            with os.scandir(path) as entries:
+                file_paths.extend(sorted(entry.path for entry in entries if entry.is_file()))
+        else:
+            file_paths.append(path)
+    return file_paths
+
+if __name__ == "__main__":
+    # the path to the sample is taken as an input, pass --batch first to scan several samples or directories of samples at once
+    batch = sys.argv[1:2] == ["--batch"]
+    file_paths = sys.argv[2:] if batch else sys.argv[1:2]
+    if len(file_paths) == 0:
+        output = {'results': {"Errors": [f"No sample path provided"]}}
+    elif batch:
+        # batch results are keyed by sample path but the tags file has to stay flat for the agent
+        outputs = runBatch(collectPaths(file_paths))
+        output = {
+            'results': {path: out['results'] for path, out in outputs.items()},
+            'tags': mergeTags(outputs.values()),
+        }
+    else:
+        output = run(sys.argv[1])
 
-if 'tags' in output and output['tags'] != {}:
     # write tool results to thorium results path
-    with open("/tmp/thorium/tags", "w") as f:
-        f.write(json.dumps(output['tags']))
+    with open("/tmp/thorium/results", "wb") as f:
+        f.write(dumps(output['results']))
+
+    if 'tags' in output and output['tags'] != {}:
+        # write tool results to thorium results path
+        with open("/tmp/thorium/tags", "wb") as f:
+            f.write(dumps(output['tags']))
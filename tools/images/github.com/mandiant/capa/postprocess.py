@@ -1,38 +1,47 @@
 import argparse
-import json
-import pathlib
+import os
+from concurrent.futures import ProcessPoolExecutor
 
 import capa.render.default
 import capa.render.result_document
 
+# prefer orjson for faster (de)serialization but fall back to the stdlib
+try:
+    import orjson
 
-# this is a recursive function designed to extract layered children
+    dumps = orjson.dumps
+    loads = orjson.loads
+except ImportError:
+    import json
+
+    def dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+
+    loads = json.loads
+
+
+# cast a location's value to hex without modifying the raw location
+def hexLocation(location):
+    value = location.get("value")
+    if isinstance(value, int):
+        return {**location, "value": hex(value)}
+    return location
+
+# extracts layered children by walking them with an explicit stack
 # child argument is a dictionary
 def extractChildrenMatches(child, matches):
-    # only keep the current child if it has a location value
-    currentChild = {}
-    locations = child["locations"]
-    if not locations == []:
-        currentChild = child.copy()
-        currentChild.pop("children")
-
-        # cast all location values to hex
-        for i in range(len(currentChild["locations"])):
-            if "value" in currentChild["locations"][i]:
-                try:
-                    currentChild["locations"][i]["value"] = hex(currentChild["locations"][i]["value"])
-                except:
-                    pass
-        matches.append(currentChild)
-
-    # no subchildren means end recursion, add current child and return
-    subChildren = child["children"]
-    if subChildren == []:
-        return matches
-
-    # recursively get all matches for nested sub children
-    for sc in subChildren:
-        matches = extractChildrenMatches(sc, matches)
+    stack = [child]
+    while stack:
+        current = stack.pop()
+        # only keep the current child if it has a location value
+        locations = current["locations"]
+        if locations:
+            currentChild = {key: value for key, value in current.items() if key != "children"}
+            # cast all location values to hex
+            currentChild["locations"] = [hexLocation(location) for location in locations]
+            matches.append(currentChild)
+        # push sub children in reverse so they are visited in their original order
+        stack.extend(reversed(current["children"]))
 
     return matches
 
@@ -89,26 +98,52 @@ def extractRaw(capaResults):
 
     return rawAttackRules, rawMbcRules
 
-def postprocess(raw_results):
-    with open(raw_results, "r") as f:
-        capaResults = json.load(f)
+# rule sets smaller than this aren't worth the cost of starting worker processes
+parallelRuleThreshold = 64
+
+# get how many cores this job may actually use, CAPA_WORKERS overrides it
+def availableCores():
+    if "CAPA_WORKERS" in os.environ:
+        return max(int(os.environ["CAPA_WORKERS"]), 1)
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    # the container's cpu limit is a cgroup quota that affinity doesn't reflect
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cores = min(cores, max(int(quota) // int(period), 1))
+    except (OSError, ValueError):
+        pass
+    return cores
+
+# get the tag and matches for a raw attack rule
+def extractAttackPair(rule):
+    return filterAttack(rule), extractMatches(rule)
+
+# get the tag and matches for a raw mbc rule
+def extractMbcPair(rule):
+    return filterMbc(rule), extractMatches(rule)
 
-    attackMatches = []
-    mbcMatches = []
-    attackTags = []
-    mbcTags = []
+def postprocess(raw_results):
+    with open(raw_results, "rb") as f:
+        capaResults = loads(f.read())
 
     # get tags and matches from raw capa json results
     rawAttack, rawMbc = extractRaw(capaResults)
-    for r in rawAttack:
-        attackTag = filterAttack(r)
-        attackTags.append(attackTag)
-        attackMatches.append({attackTag : extractMatches(r)})
-
-    for r in rawMbc:
-        mbcTag = filterMbc(r)
-        mbcTags.append(mbcTag)
-        mbcMatches.append({mbcTag : extractMatches(r)})
+    # rules are independent so spread large rule sets across the cores this job may use
+    workers = availableCores()
+    if workers > 1 and len(rawAttack) + len(rawMbc) >= parallelRuleThreshold:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            attackPairs = list(executor.map(extractAttackPair, rawAttack, chunksize=32))
+            mbcPairs = list(executor.map(extractMbcPair, rawMbc, chunksize=32))
+    else:
+        attackPairs = [extractAttackPair(r) for r in rawAttack]
+        mbcPairs = [extractMbcPair(r) for r in rawMbc]
+
+    attackTags = [attackTag for attackTag, _ in attackPairs]
+    attackMatches = [{attackTag : matches} for attackTag, matches in attackPairs]
+    mbcTags = [mbcTag for mbcTag, _ in mbcPairs]
+    mbcMatches = [{mbcTag : matches} for mbcTag, matches in mbcPairs]
 
     # combine results
     results = {}
@@ -116,7 +151,8 @@ def postprocess(raw_results):
     results["results"] = {"ATT&CK" : attackMatches ,"MBC" : mbcMatches}
     results["tags"] = tags
 
-    return results
+    # return the raw capa results as well so callers don't need to parse them again
+    return results, capaResults
 
 
 def main():
@@ -136,19 +172,19 @@ def main():
     args = parser.parse_args()
 
     # post-process to extract our desired tags
-    output = postprocess(args.raw_results)
+    output, capaResults = postprocess(args.raw_results)
 
     # write abbreviated results to thorium results path
-    with open(args.results, "w") as f:
-        json.dump(output["results"], f)
+    with open(args.results, "wb") as f:
+        f.write(dumps(output["results"]))
 
     if output.get("tags"):
         # write tool results to thorium results path
-        with open(args.tags, "w") as f:
-            json.dump(output["tags"], f)
+        with open(args.tags, "wb") as f:
+            f.write(dumps(output["tags"]))
 
     # output the default capa text for the result document
-    doc = capa.render.result_document.ResultDocument.from_file(pathlib.Path(args.raw_results))
+    doc = capa.render.result_document.ResultDocument.model_validate(capaResults)
     capa.render.default.render_default(doc)
 
 if __name__ == "__main__":
@@ -1,22 +1,32 @@
 import sys
-import json
 import os
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+# prefer orjson for faster serialization but fall back to the stdlib
+try:
+    import orjson
+
+    dumps = orjson.dumps
+except ImportError:
+    import json
+
+    def dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+
 
 def run(file_path):
     # run capa tool on sample
     cmd = ['/app/capa', '-q', file_path]
-    proc = subprocess.Popen(cmd,
-                            shell=False,
-                            stdout=subprocess.PIPE,
-                            stderr=subprocess.PIPE)
-    out, err = proc.communicate()
+    proc = subprocess.run(cmd,
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE)
     errcode = proc.returncode
-    decout = out.decode("utf-8", errors="replace")
-        
+    decout = proc.stdout.decode("utf-8", errors="replace")
+    decerr = proc.stderr.decode("utf-8", errors="replace")
+
     # process Capa results
     if decout.strip() == "":
-        decerr = err.decode("utf-8", errors="replace")
         warning = f"Warning: Capa could not process {file_path}"
         decout = f"{warning}:\n{decerr}"
 
@@ -25,25 +35,62 @@ def run(file_path):
         os.remove(file_path + ".viv")
 
     tags = {}
-    # upload tags for capa output
-    if "This sample appears to be packed" in decout:
+    # upload tags for capa output, capa logs its packed warning to stderr
+    packed = "This sample appears to be packed"
+    if packed in decerr or packed in decout:
         tags = {"Packed": f"True"}
 
     # return results dict
     return {'results': decout, 'tags': tags}
 
-# the path to the sample is taken as an input
-if len(sys.argv) == 1:
-    output = {'results': {"Errors": [f"No sample path provided"]}}
-else:
-    output = run(sys.argv[1])
+def run_batch(file_paths):
+    # capa can't scan multiple samples in one call so overlap the calls instead
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        return dict(zip(file_paths, executor.map(run, file_paths)))
+
+# merge the tags of every sample into one list of unique values per tag
+def merge_tags(outputs):
+    merged = {}
+    for output in outputs:
+        for key, value in output['tags'].items():
+            values = merged.setdefault(key, {})
+            # the agent doesn't accept nested lists so flatten any list values
+            for item in (value if isinstance(value, list) else [value]):
+                values[item] = None
+    return {key: list(values) for key, values in merged.items()}
 
-# write tool results to thorium results path
-with open("/tmp/thorium/results", "w") as f:
-    f.write(json.dumps(output['results']))
+# expand any sample directories into the files they contain
+def collect_paths(paths):
+    file_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            with os.scandir(path) as entries:
+                file_paths.extend(sorted(entry.path for entry in entries if entry.is_file()))
+        else:
+            file_paths.append(path)
+    return file_paths
 
+if __name__ == "__main__":
+    # the path to the sample is taken as an input, pass --batch first to scan several samples or directories of samples at once
+    batch = sys.argv[1:2] == ["--batch"]
+    file_paths = sys.argv[2:] if batch else sys.argv[1:2]
+    if len(file_paths) == 0:
+        output = {'results': {"Errors": [f"No sample path provided"]}}
+    elif batch:
+        # batch results are keyed by sample path but the tags file has to stay flat for the agent
+        outputs = run_batch(collect_paths(file_paths))
+        output = {
+            'results': {path: out['results'] for path, out in outputs.items()},
+            'tags': merge_tags(outputs.values()),
+        }
+    else:
+        output = run(sys.argv[1])
 
-if 'tags' in output and output['tags'] != {}:
     # write tool results to thorium results path
-    with open("/tmp/thorium/tags", "w") as f:
-        f.write(json.dumps(output['tags']))
+    with open("/tmp/thorium/results", "wb") as f:
+        f.write(dumps(output['results']))
+
+    if 'tags' in output and output['tags'] != {}:
+        # write tool results to thorium results path
+        with open("/tmp/thorium/tags", "wb") as f:
+            f.write(dumps(output['tags']))
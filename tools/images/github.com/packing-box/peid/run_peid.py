@@ -1,29 +1,34 @@
+import os
 import sys
-import json
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+# prefer orjson for faster serialization but fall back to the stdlib
+try:
+    import orjson
+
+    dumps = orjson.dumps
+except ImportError:
+    import json
+
+    def dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+
 
 out_filepath = "/tmp/thorium/results"
 
 # filter a list to return valid lines
 def filterValidLines(split):
-    validLines = []
-    for s in split:
-        if len(s) > 1:
-            validLines.append(s)
+    return [s for s in split if len(s) > 1]
 
-    return validLines
+# filter a list to return unique valid lines in a single pass
+def filterValidUniqueLines(split):
+    return list(dict.fromkeys(s for s in split if len(s) > 1))
 
 # extract tags from die output
 def extractTags(strOutput):
     tags = {}
-
-    split = strOutput.split("\n")
-    uniques = list(dict.fromkeys(split))
-
-    # filter results
-    validTags = filterValidLines(uniques)
-    tags['Detections'] = validTags
-
+    tags['Detections'] = filterValidUniqueLines(strOutput.splitlines())
     return tags
 
 def extractError(errOutput):
@@ -61,17 +66,58 @@ def run(file_path):
 
     return {'results': results, 'tags': tags}
 
-# the path to the sample is taken as an input
-if len(sys.argv) == 1:
-    output = {'results': {"Errors": [f"No sample path provided"]}}
-else:
-    output = run(sys.argv[1])
+def runBatch(file_paths):
+    # peid can't scan multiple samples in one call so overlap the calls instead
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        return dict(zip(file_paths, executor.map(run, file_paths)))
+
+# merge the tags of every sample into one list of unique values per tag
+def mergeTags(outputs):
+    merged = {}
+    for output in outputs:
+        for key, value in output['tags'].items():
+            values = merged.setdefault(key, {})
+            # the agent doesn't accept nested lists so flatten any list values
+            for item in (value if isinstance(value, list) else [value]):
+                values[item] = None
+    return {key: list(values) for key, values in merged.items()}
+
+# expand any sample directories into the files they contain
+def collectPaths(paths):
+    file_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            with os.scandir(path) as entries:
+                file_paths.extend(sorted(entry.path for entry in entries if entry.is_file()))
+        else:
+            file_paths.append(path)
+    return file_paths
+
+if __name__ == "__main__":
+    # the path to the sample is taken as an input, pass --batch first to scan several samples or directories of samples at once
+    batch = sys.argv[1:2] == ["--batch"]
+    file_paths = sys.argv[2:] if batch else sys.argv[1:2]
+    if len(file_paths) == 0:
+        output = {'results': {"Errors": [f"No sample path provided"]}}
+    elif batch:
+        # batch results are keyed by sample path but the tags file has to stay flat for the agent
+        outputs = runBatch(collectPaths(file_paths))
+        output = {
+            'results': {path: out['results'] for path, out in outputs.items()},
+            'tags': mergeTags(outputs.values()),
+        }
+    else:
+        output = run(sys.argv[1])
 
-# write tool results to thorium results path
-with open("/tmp/thorium/results", "w") as f:
-    f.write(output['results'])
+    # write tool results to thorium results path, single sample results are raw peid output
+    if isinstance(output['results'], str):
+        with open("/tmp/thorium/results", "wb") as f:
+            f.write(output['results'].encode('utf-8'))
+    else:
+        with open("/tmp/thorium/results", "wb") as f:
+            f.write(dumps(output['results']))
 
-if 'tags' in output and output['tags'] != {}:
-    # write tool results to thorium results path
-    with open("/tmp/thorium/tags", "w") as f:
-        f.write(json.dumps(output['tags']))
+    if 'tags' in output and output['tags'] != {}:
+        # write tool results to thorium results path
+        with open("/tmp/thorium/tags", "wb") as f:
+            f.write(dumps(output['tags']))
@@ -6,6 +6,12 @@ import hashlib
 from signify import exceptions as sig_except
 from signify.authenticode import AuthenticodeFile
 
+# patterns for pulling a short name out of a certificate attribute
+_CN_COMMA = re.compile(r'CN=(.+?),')
+_CN_END = re.compile(r'CN=(.+)')
+_OU = re.compile(r'OU=(.+?),')
+_O = re.compile(r'O=(.+?),')
+
 def get_certs_from_file(filepath):
     '''returns string containing certificate dump of file at filepath'''
     with open(filepath, "rb") as f:
@@ -74,8 +80,10 @@ def cert_dump(cert):
     cert_dict['subject'] = cert.subject.dn
     cert_dict['not_before'] = cert.valid_from.isoformat()
     cert_dict['not_after'] = cert.valid_to.isoformat()
-    cert_dict['md5'] = hashlib.md5(cert.to_der).hexdigest()
-    cert_dict['sha1'] = hashlib.sha1(cert.to_der).hexdigest()
+    # to_der re-encodes the certificate so only build it once for both hashes
+    der = cert.to_der
+    cert_dict['md5'] = hashlib.md5(der, usedforsecurity=False).hexdigest()
+    cert_dict['sha1'] = hashlib.sha1(der, usedforsecurity=False).hexdigest()
     return cert_dict
     
     
@@ -83,15 +91,11 @@ def get_short_name(attr):
     '''return CN field of given certificate attribute'''
     attr = str(attr)
     if 'CN=' in attr:
-        regex_obj = re.search('CN=(.+?),', attr) 
-        if regex_obj:
-            short_name = regex_obj.group(1)
-        else:
-            short_name = re.search('CN=(.+)', attr).group(1)
+        match = _CN_COMMA.search(attr) or _CN_END.search(attr)
     elif 'OU=' in attr:
-        short_name = re.search('OU=(.+?),', attr).group(1)
+        match = _OU.search(attr)
     elif 'O=' in attr:
-        short_name = re.search('O=(.+?),', attr).group(1)
+        match = _O.search(attr)
     else:
-        short_name = "Unknown Source"
-    return short_name
+        return "Unknown Source"
+    return match.group(1)
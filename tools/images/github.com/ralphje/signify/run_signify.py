@@ -1,8 +1,19 @@
 from signify import exceptions as sig_except
-import json
 import pe_certs
 import sys
 
+# prefer orjson for faster serialization but fall back to the stdlib
+try:
+    import orjson
+
+    dumps = orjson.dumps
+except ImportError:
+    import json
+
+    def dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+
+
 def run(file_path):
     output = {}
     try:
@@ -23,5 +34,5 @@ if len(sys.argv) == 1:
 else:
     output = run(sys.argv[1])
 
-with open("/tmp/thorium/results", "w") as f:
-    f.write(json.dumps(output))
+with open("/tmp/thorium/results", "wb") as f:
+    f.write(dumps(output))
@@ -15,31 +15,58 @@ import os
 import pathlib
 import re
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
 from uefi_firmware.uefi import *
 from uefi_firmware.generator import uefi as uefi_generator
 from uefi_firmware import AutoParser
 import uefi_firmware.utils # import nocolor
 
-def _find_objects(_object, types):
+# the section types to search firmware files for and the group each is collected into
+_SECTION_GROUPS = {
+    "PE32": "bins",
+    "PIC": "bins",
+    "TE": "bins",
+    "UI": "names",
+    "VERSION": "versions",
+}
+
+
+def _find_objects(_object, files):
     """
-    Recursively search for objects with the given types below the given object.
+    Recursively search for sections with the _SECTION_GROUPS types below the given object.
+
+    The tree is only walked once, every firmware file that could hold a binary is
+    added to files in tree order along with the sections found below it.
     """
-    objects = []
+    found = {group: [] for group in _SECTION_GROUPS.values()}
+    get_section_type = EFI_SECTION_TYPES.get
     for _object2 in _object.objects:
         if _object2 is None:
             continue
 
         _type = None
         if hasattr(_object2, "type"):
-            _type = EFI_SECTION_TYPES.get(_object2.type)
+            _type = get_section_type(_object2.type)
+
+        if _type is not None and _type[2] in _SECTION_GROUPS:
+            found[_SECTION_GROUPS[_type[2]]].append(_object2)
 
-        if _type is not None and _type[2] in types:
-            objects.append(_object2)
+        # reserve this file's spot before recursing so files stay in tree order
+        slot = None
+        if isinstance(_object2, FirmwareFile) and EFI_FILE_TYPES[_object2.type][2] not in ["RAW", "FV_IMAGE"]:
+            slot = len(files)
+            files.append(None)
 
-        objects.extend(_find_objects(_object2, types))
+        found2 = _find_objects(_object2, files)
+        if slot is not None:
+            files[slot] = (_object2, found2)
 
-    return objects
+        # sections below this child are also below the given object
+        for group, objects in found2.items():
+            found[group].extend(objects)
+
+    return found
 
 
 def _sanitize_filename(s):
@@ -52,57 +79,69 @@ def _sanitize_filename(s):
     return sanitized.strip().strip(".")
 
 
-def _extract_objects(parsed_object):
+def _collect_objects(parsed_object):
     """
-    Recursively extract objects that appear to be executables
+    Collect the output paths and data of objects that appear to be executables
     """
-    count = 0
-    for _object in parsed_object.objects:
-        if _object is None:
+    files = []
+    _find_objects(parsed_object, files)
+
+    items = []
+    claimed = set()
+    for _object, found in files:
+        bins = found["bins"]
+        names = found["names"]
+        versions = found["versions"]
+
+        if len(bins) == 0:
             continue
 
-        if isinstance(_object, FirmwareFile):
-            if EFI_FILE_TYPES[_object.type][2] in ["RAW"]:
-                count += _extract_objects(_object)
-                continue
-            elif EFI_FILE_TYPES[_object.type][2] in ["FV_IMAGE"]:
-                count += _extract_objects(_object)
-                continue
+        if len(bins) > 1 or len(names) > 1:
+            logging.warning("more than one binary and name found, using only the first of each")
+
+        name = None
+        if len(names) == 1:
+            name = _sanitize_filename(names[0].name)
+        else:
+            name = _sanitize_filename(uefi_firmware.utils.sguid(_object.guid))
 
-            bins = _find_objects(_object, {"PE32", "PIC", "TE"})
-            names = _find_objects(_object, {"UI"})
-            versions = _find_objects(_object, {"VERSION"})
+        fpath = pathlib.Path(args.output).joinpath(name + ".bin")
 
-            if len(bins) == 0:
-                continue
+        i = 0
 
-            if len(bins) > 1 or len(names) > 1:
-                logging.warning("more than one binary and name found, using only the first of each")
+        # paths are claimed before anything is written so check both
+        while fpath in claimed or fpath.exists():
+            i += 1
+            fpath = fpath.with_name(name + f"-{i}.bin")
 
-            name = None
-            if len(names) == 1:
-                name = _sanitize_filename(names[0].name)
-            else:
-                name = _sanitize_filename(uefi_firmware.utils.sguid(_object.guid))
+        claimed.add(fpath)
+        items.append((fpath, bins[0].data))
 
-            fpath = pathlib.Path(args.output).joinpath(name + ".bin")
+    return items
 
-            i = 0
 
-            while fpath.exists():
-                i += 1
-                fpath = fpath.with_name(name + f"-{i}.bin")
+def _write_object(item):
+    """
+    Write a collected object to its output path
+    """
+    fpath, data = item
+    logging.info("writing to binary: %s", fpath)
+    fpath.write_bytes(data)
 
-            logging.info("writing to binary: %s", fpath)
-            with fpath.open("wb") as f:
-                f.write(bins[0].data)
 
-            count += 1
+def _extract_objects(parsed_object):
+    """
+    Extract objects that appear to be executables
+    """
+    # collision suffixes are resolved before any writes so the writes can't race
+    items = _collect_objects(parsed_object)
 
-        # recurse recurse
-        count += _extract_objects(_object)
+    # the writes are independent so overlap them
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        # consume the results so any write errors are raised
+        list(executor.map(_write_object, items))
 
-    return count
+    return len(items)
 
 
 if __name__ == "__main__":
@@ -1,73 +1,45 @@
 import sys
-import json
 import os
 import subprocess
+from collections import defaultdict
 
-# combines two tag dictionaries into one
-# assumes that values are arrays
-def combineTags(tags1, tags2):
-    for key in tags2:
-        if not key in tags1:
-            tags1[key] = tags2[key]
-        else:
-            tags1[key].append(tags2[key][0])
-
-    return tags1
-
-def extractTags(detection):
-    tags = {}
-    if "extension" in detection:
-        tags["FileTypeExtension"] = [detection["extension"]]
-    if "value" in detection:
-        tags["FileTypeMatch"] = [detection["value"]]
-    if "name" in detection:
-        tags["MIMEType"] = [detection["name"]]
-        tags["FileType"] = []
-        for subElement in detection['subEls']:
-            if ("type" in subElement):
-                tags["FileType"].append(subElement["type"].upper())
-        if len(tags["FileType"]) == 0:
-            del tags["FileType"]
-
-    tags = trimTags(tags)
-    return tags
+# prefer orjson for faster (de)serialization but fall back to the stdlib
+try:
+    import orjson
 
-# strip whitespace from tags
-def trimTags(tags):
-    trimmedTags = {}
-    for key in tags:
-        tagList = tags[key]
-        newList = []
-        for i in tagList:
-            newList.append(i.strip())
-        trimmedTags[key] = newList
-    return trimmedTags
+    dumps = orjson.dumps
+    loads = orjson.loads
+except ImportError:
+    import json
 
-# do final processing/filtering on tags
-def doProcessing(tags):
-    finalTags = {}
-    
-    for key in tags:
-        value = tags[key]
-        if len(value) < 2:
-            finalTags[key] = value[0]
-        else:
-            finalTags[key] = value
+    def dumps(obj):
+        return json.dumps(obj).encode('utf-8')
 
-    return finalTags
+    loads = json.loads
 
-def getTags(resultJson):
-    tags = {}
-    counter = 0
 
-    if "struc" in resultJson:
-        detectionData = resultJson['struc']
-        for detection in detectionData:
-            extractedTags = extractTags(detection)
-            tags = combineTags(tags, extractedTags)
-            counter += 1
+# do final processing/filtering on tags
+def doProcessing(tags):
+    return {key: (value[0] if len(value) == 1 else value) for key, value in tags.items()}
 
-    if counter > 1:
+# builds tags from every detection in a single pass
+def getTags(resultJson):
+    tags = defaultdict(list)
+    detectionData = resultJson.get('struc', [])
+    for detection in detectionData:
+        # strip whitespace from tags as they are added
+        if "extension" in detection:
+            tags["FileTypeExtension"].append(detection["extension"].strip())
+        if "value" in detection:
+            tags["FileTypeMatch"].append(detection["value"].strip())
+        if "name" in detection:
+            tags["MIMEType"].append(detection["name"].strip())
+            for subElement in detection['subEls']:
+                if ("type" in subElement):
+                    tags["FileType"].append(subElement["type"].upper().strip())
+    tags = dict(tags)
+
+    if len(detectionData) > 1:
         tags['Polyglot'] = True
 
     return tags
@@ -89,23 +61,20 @@ def run(filepath):
         '--format', 'json',
         '--output', jsonOutput,
         filepath]
-    proc = subprocess.Popen(cmd,
-                            shell=False,
-                            stdout=subprocess.PIPE,
-                            stderr=subprocess.PIPE)
-    out, err = proc.communicate()
+    proc = subprocess.run(cmd, capture_output=True)
+    out, err = proc.stdout, proc.stderr
     errcode = proc.returncode
 
-    # read in JSON to build tags
-    rawData = open(jsonOutput, "r").read()
-
-    with open(jsonOutput, "w") as f:
-        resultJson = json.loads(rawData)
+    # read in JSON to build tags and rewrite it in place with the same handle
+    with open(jsonOutput, "r+b") as f:
+        resultJson = loads(f.read())
         resultJson.pop('b64contents', None)
-        for element in resultJson['struc']:
+        for element in resultJson.get('struc', []):
             for subEl in element['subEls']:
                 subEl.pop('value', None)
-        f.write(json.dumps(resultJson))
+        f.seek(0)
+        f.write(dumps(resultJson))
+        f.truncate()
         # tagging can be enabled here, but lots of false positives
         # tags = getTags(resultJson)
         # result['tags'] = tags
@@ -120,6 +89,6 @@ else:
 
 if 'tags' in output and output['tags'] != {}:
     # write tool results to thorium results path
-    with open("/tmp/thorium/tags", "w") as f:
-        f.write(json.dumps(output['tags']))
+    with open("/tmp/thorium/tags", "wb") as f:
+        f.write(dumps(output['tags']))
 
@@ -1,14 +1,32 @@
 import sys
 import os
+import re
+from collections import defaultdict
+from multiprocessing import Pool
 
 
 # line length greater than 5 is min requirement for containing the rule's name
 # ie: "rule xyz : whatever"
 def validRuleline(line):
-    return len(line) > 5 and line[:5].__contains__("rule ")
+    return len(line) > 5 and line.startswith("rule ")
 
 def isPrivateRule(line):
-    return len(line) > 8 and line[:8].__contains__("private")
+    return len(line) > 8 and "private" in line[:8]
+
+# the contents of each rule file so every file is only read from disk once
+fileCache = {}
+
+def readRule(filename):
+    if filename not in fileCache:
+        with open(filename, "r") as f:
+            fileCache[filename] = f.read()
+    return fileCache[filename]
+
+# write a rule file and keep its cached contents in sync
+def writeRule(filename, rawData):
+    with open(filename, "w") as f:
+        f.write(rawData)
+    fileCache[filename] = rawData
 
 # four different options here
 # option 1 - rule xyz \n
@@ -16,7 +34,7 @@ def isPrivateRule(line):
 # option 3 - rule xyz : whatever \n
 # option 4 - rule xyz : whatever {\n
 def extractName(filename):
-    rawData = open(filename, "r").read()
+    rawData = readRule(filename)
     split = rawData.split("\n")
 
     for s in split:
@@ -27,100 +45,84 @@ def extractName(filename):
     return "ERROR"
 
 
-def getMatchingFiles(name, nameMap):
-    result = []
-    for key in nameMap:
-        value = nameMap[key]
-        if value == name:
-            result.append(key)
-    return result
+# matches the name on the first rule line of a file with the given rule name
+def compileNamePattern(name):
+    return re.compile(r"^(rule[ \t]+)" + re.escape(name) + r"\b", re.MULTILINE)
 
-# returns the first insance of the name line
-def getNameLine(rawData):
-    split = rawData.split("\n")
-    for s in split:
-        if validRuleline(s):
-            return s
-    return "NO_NAME"
-
-def alterName(f, name, counter):
-    inFile = open(f, "r")
-    rawData = inFile.read()
-    inFile.close()
+def alterName(f, namePattern, newName):
+    rawData = readRule(f)
 
-    nameLine = getNameLine(rawData)
+    # rename only the rule line itself in a single pass over the file
+    newData = namePattern.sub(lambda match: match.group(1) + newName, rawData, count=1)
+    writeRule(f, newData)
 
-    newNameLine = nameLine.replace(name, f"{name}_{counter}")
-    newData = rawData.replace(nameLine, newNameLine)
-
-    # do nothing if counter is 0
-    if counter == 0:
-        pass
-    else:
-        outFile = open(f, "w")
-        outFile.write(newData)
-        outFile.close()
+# returns whether a file has multiple yara rules in it
+def hasMultipleRules(filename):
+    rawData = readRule(filename)
+    split = rawData.split("\n")
+    
+    counter = 0
+    for s in split:
+        if validRuleline(s) or isPrivateRule(s):
+            counter += 1
+            # stop as soon as a second rule is found
+            if counter > 1:
+                return True
+    return False
+
+# scan a rule file in a pool worker, reading it only once
+def scanRule(filename):
+    multiple = hasMultipleRules(filename)
+    name = extractName(filename)
+    # the worker's cache is thrown away so hand the contents back for the parent to cache
+    return filename, fileCache.pop(filename), multiple, name
 
 # deletes all files with multiple yara rules in the same file
 # multiple yara rules in the same file causes a bug with renaming
-def deleteMultipleRules(filenames):
-    for f in filenames:
-        rawData = open(f, "r").read()
-        split = rawData.split("\n")
-        
-        counter = 0
-        for s in split:
-            if validRuleline(s) or isPrivateRule(s):
-                counter += 1
-
-        if counter > 1:
+def deleteMultipleRules(scans):
+    for f, _, multiple, _ in scans:
+        if multiple:
             print(f"Removing Rule:{f}")
-            os.system(f"rm {f}")
+            os.unlink(f)
 
-def pruneFilenames(filenames):
-    prunedFilenames = []
-    
-    for f in filenames:
-        if f.__contains__(".yar") and not f[0] == ".":
-            prunedFilenames.append(f)
-    return prunedFilenames
+# the extensions yara rule files are copied in with
+ruleExtensions = (".yar", ".yara")
 
+# list the visible rule files in a directory in a single pass
 def getAllFiles(yaraDir):
-    finalFilenames = []
-    filenames = next(os.walk(yaraDir), (None, None, []))[2]
-    for f in filenames:
-        relPath = f"{yaraDir}/{f}"
-        finalFilenames.append(relPath)
-    return pruneFilenames(finalFilenames)
-
-args = sys.argv
-if not len(args) == 2:
-    print("Use Case: python3 renameRules.py <yaraDirectoryToAlter>")
-    exit(1)
-else:
-    print("Removing Bad Rules...")
-
-yaraDir = args[1]
-filenames = getAllFiles(yaraDir)
-# delete files with multiple rules
-deleteMultipleRules(filenames)
-filenames = getAllFiles(yaraDir)
-
-
-# create a mapping of all the names
-nameMap = {}
-for f in filenames:
-    if f.__contains__(".yar"):
-        nameMap[f] = extractName(f)
-
-# get all unique rulenames
-uniqueNames = list(dict.fromkeys(list(nameMap.values())))
-
-finalRules = []
-for name in uniqueNames:
-    matchingFiles = getMatchingFiles(name, nameMap)
-    counter = 0
-    for f in matchingFiles:
-        alterName(f, name, counter)
-        counter += 1
-    counter = 0
+    with os.scandir(yaraDir) as entries:
+        return [os.path.join(yaraDir, entry.name) for entry in entries
+                if entry.is_file() and entry.name.endswith(ruleExtensions) and not entry.name.startswith(".")]
+
+if __name__ == "__main__":
+    args = sys.argv
+    if not len(args) == 2:
+        print("Use Case: python3 renameRules.py <yaraDirectoryToAlter>")
+        exit(1)
+    else:
+        print("Removing Bad Rules...")
+
+    yaraDir = args[1]
+    with Pool() as pool:
+        # files are scanned independently so spread them across the pool
+        scans = pool.map(scanRule, getAllFiles(yaraDir), chunksize=64)
+    # delete files with multiple rules
+    deleteMultipleRules(scans)
+
+    # create a mapping of all the names and cache the contents the workers read for renaming
+    nameMap = {}
+    for f, rawData, multiple, name in scans:
+        if not multiple:
+            fileCache[f] = rawData
+            nameMap[f] = name
+
+    # group the files by their rule name in a single pass
+    groups = defaultdict(list)
+    for f, name in nameMap.items():
+        groups[name].append(f)
+
+    for name, matchingFiles in groups.items():
+        namePattern = compileNamePattern(name)
+        # the first file keeps its name so it is never read or rewritten
+        for counter, f in enumerate(matchingFiles[1:], start=1):
+            alterName(f, namePattern, f"{name}_{counter}")
@@ -4,43 +4,37 @@ import os
 import subprocess
 import re
 
-def yara_formatter(raw: str):
+# matches a single hit line from yara's output
+yara_regex = re.compile(rb'^([^ \n]+) \[(.*)\] (\[.*\]) .*$', re.MULTILINE)
+
+def yara_formatter(raw: bytes):
     '''
     formats the results from yara
 
     Args:
-        raw (str): the raw string to format
+        raw (bytes): the raw output to format
     Returns:
         list: formatted list of hits
     '''
-    regex = re.compile(r'([^ ]+) \[(.*)\] (\[.*\]) .*')
     hits = []
-    lines = raw.splitlines()
-    for l in lines:
+    # match every hit in the raw output at once and only decode the matched groups
+    for m in yara_regex.finditer(raw):
         entry = {}
-        m = regex.search(l)
-        if m:
-            entry['rule'] = m.group(1)
-            entry['tags'] = m.group(2).split(',')
-            entry['meta'] = m.group(3)
-            hits.append(entry)
+        entry['rule'] = m.group(1).decode("utf-8")
+        entry['tags'] = m.group(2).decode("utf-8").split(',')
+        entry['meta'] = m.group(3).decode("utf-8")
+        hits.append(entry)
     return hits
 
 def run(file_path):
     # run yara tool on sample
     cmd = ['yara', '-w', '-g', '-m', '-C', 'rules.bin', file_path]
-    proc = subprocess.Popen(cmd,
-                            shell=False,
-                            stdout=subprocess.PIPE,
-                            stderr=subprocess.PIPE)
-    proc.wait()
-    out, err = proc.communicate()
+    proc = subprocess.run(cmd, capture_output=True)
+    out, err = proc.stdout, proc.stderr
     errcode = proc.returncode
 
-    # return results
-    # decode and format results
-    decout = out.decode("utf-8")
-    formatted = yara_formatter(decout)
+    # format results
+    formatted = yara_formatter(out)
 
     tags = {}
     rules = []
@@ -1,38 +1,31 @@
 import sys
 import json
+import re
 import subprocess
 
 # tool will only tag detections above this limit (25%)
 tagDetectionLimit = 25
 
 
-def aboveDetectionThreshold(line):
-    split = line.split("%")
-    detectionValue = int(float(split[0]))
+# matches a detection line like " 48.8% (.EXE) Win64 Executable (generic) (10523/12/4)"
+detectionRegex = re.compile(r'^ *(\d+\.\d+)% +\S+ +(.+?) +\(\S+\)\s*$', re.MULTILINE)
+
+def aboveDetectionThreshold(percent):
+    detectionValue = int(float(percent))
     return detectionValue > tagDetectionLimit
 
-# extracts tags of matches by newlines
+# extracts tags of matches in a single pass over the results
 def extractTags(results):
     tags = {}
-    tags['FileTypeMatch'] = []
-    split = results.split("\n")
-    for s in split:
-        if "%" in s and aboveDetectionThreshold(s):
-            lineSplit = s.split(" ")
-            # cut off percentage part of results and last chunk
-            nameSection = lineSplit[3:len(lineSplit) - 1]
-            name = " ".join(nameSection)
-            tags['FileTypeMatch'].append(name)
+    tags['FileTypeMatch'] = [m.group(2) for m in detectionRegex.finditer(results)
+                             if aboveDetectionThreshold(m.group(1))]
     return tags
 
 
 def run(file_path):
     cmd = ['./trid', file_path]
-    proc = subprocess.Popen(cmd,
-                            shell=False,
-                            stdout=subprocess.PIPE,
-                            stderr=subprocess.PIPE)
-    out, err = proc.communicate()
+    proc = subprocess.run(cmd, capture_output=True)
+    out, err = proc.stdout, proc.stderr
     errcode = proc.returncode
     # process results
     results = out.decode("utf-8")
@@ -1,6 +1,26 @@
 import math
-import matplotlib.pyplot as plt
+import numpy as np
 import matplotlib as mp
+# plots are only ever saved to disk so skip probing for an interactive backend
+mp.use('Agg')
+import matplotlib.pyplot as plt
+
+# create color map for bar color gradient
+color_map = mp.colors.LinearSegmentedColormap(
+    "freq_color_map",
+    {
+        "red": [(0, 1.0, 1.0),
+                (1.0, .5, .5)],
+        "green": [(0, 0.5, 0.5),
+                  (1.0, 0, 0)],
+        "blue": [(0, 0.50, 0.5),
+                 (1.0, 0, 0)]
+    }
+)
+
+# the bar chart is built once and reused for every plot
+chart = None
+ax = None
 
 def calcByteFreq(sample):
     '''
@@ -8,17 +28,19 @@ def calcByteFreq(sample):
     
     Args: 
         sample (string): path to sample file
+    Returns:
+        numpy.ndarray: count of each byte value
     '''
-    with open(sample, 'rb') as f:
-        # initialize bytefreq count to zero
-        byte_freq = [0] * 256
-        # read characters from file and update byte freq counts
-        byte = f.read(1)
-        while byte != b"":
-            byte_freq[ord(byte)] += 1
-            byte = f.read(1)
+    # count bytes a chunk at a time so large samples never need to fit in memory
+    counts = np.zeros(256, dtype=np.int64)
+    # read every chunk into the same buffer instead of allocating a new one each time
+    buffer = bytearray(1 << 20)
+    view = memoryview(buffer)
+    with open(sample, 'rb', buffering=0) as f:
+        while size := f.readinto(buffer):
+            counts += np.bincount(np.frombuffer(view[:size], dtype=np.uint8), minlength=256)
 
-        return byte_freq
+    return counts
 
 def calcVariance(byte_freq):
     '''
@@ -27,41 +49,32 @@ def calcVariance(byte_freq):
     in order to allow the number to be compared across samples.
 
     Args:
-        byte_freq (list): frequency of each unicode character within a file
+        byte_freq (numpy.ndarray): frequency of each unicode character within a file
     '''
+    counts = np.asarray(byte_freq, dtype=np.float64)
     # number of bytes in the file
-    total = sum(byte_freq) 
+    total = counts.sum()
+    if total == 0:
+        return 0.0
     # percentage of bytes that would appear in each bucket if uniformly distributed
     expected = 1.0 / 256 * 100
-    # calculate variance 
-    variance = 0.0
-    for i, count in enumerate(byte_freq):
-        if total > 0:
-            xi = 1.0 * count / total * 100
-            variance += math.pow(xi - expected, 2)
-        else:
-            break
-    return variance / 256
+    # calculate variance over the percentage of bytes in each bucket
+    percents = counts / total * 100
+    return float(np.sum((percents - expected) ** 2) / 256)
 
 def makeByteFreqPlot(byte_freq, graph):
     '''
     create byte frequency bar chart
 
     Args:
-        byte_freq (list): frequency of each unicode character within a file
+        byte_freq (numpy.ndarray): frequency of each unicode character within a file
         graph (string): path to output bar graph
     '''
     xLabels = ['00', 'LF', '0', '9', 'A', 'Z', 'a', 'z', 'FF']
     xTicks = [0, 10, 48, 57, 65, 90, 97, 122, 255]
 
     # get max byte frequency and set min freq to 1
-    maxCount = 1
-    for i, byte in enumerate(byte_freq):
-            if byte > maxCount:
-                maxCount = byte
-  
-    if maxCount == 0:
-        maxCount = 1;
+    maxCount = max(int(byte_freq.max()), 1)
     
     maxY = int(math.log(maxCount, 10)) + 1
     maxYTick = math.log(maxCount, 10)
@@ -75,27 +88,20 @@ def makeByteFreqPlot(byte_freq, graph):
     yLabels.append(maxCount)
     
     # take log of normalized byte freqs
-    dataSet = [(i, math.log(val if val >= 1 else 1, 10)) for i, val in enumerate(byte_freq)]
-    byte_list,freq_list = map(list,zip(*dataSet))
+    byte_list = np.arange(256)
+    freq_list = np.log10(np.maximum(byte_freq, 1))
     
-    # create color map and normalizer for bar color gradient
+    # create normalizer for bar color gradient
     data_normalizer = mp.colors.Normalize()
-    color_map = mp.colors.LinearSegmentedColormap(
-        "freq_color_map",
-        {
-            "red": [(0, 1.0, 1.0),
-                    (1.0, .5, .5)],
-            "green": [(0, 0.5, 0.5),
-                      (1.0, 0, 0)],
-            "blue": [(0, 0.50, 0.5),
-                     (1.0, 0, 0)]
-        }
-    )
     
-    # initialize bar chart and style params
-    chart = plt.figure()
-    chart.set_size_inches(2.75, 1.75)
-    ax = chart.add_axes([0,0,2.75,1.75])
+    # initialize bar chart or clear the previous plot and set style params
+    global chart, ax
+    if chart is None:
+        chart = plt.figure()
+        chart.set_size_inches(2.75, 1.75)
+        ax = chart.add_axes([0,0,2.75,1.75])
+    else:
+        ax.clear()
     ax.bar(byte_list, freq_list, color=color_map(data_normalizer(freq_list)), align='edge', width=0.5)
     ax.set_title("Byte Frequency", fontsize=16)
     
@@ -6,12 +6,14 @@ def run(file_path):
 
     # run bytefreq tool on sample and create graph file
     results = dict()
-    results["bytecount"] = utils.calcByteFreq(file_path)
-    results["variance"] = utils.calcVariance(results["bytecount"])
+    # keep the counts in a single array for every calculation
+    counts = utils.calcByteFreq(file_path)
+    results["bytecount"] = counts.tolist()
+    results["variance"] = utils.calcVariance(counts)
     file_name = file_path.split('/')[-1]
     graph_name = f'freq-graph-{file_name}.png'
     graph_path = f'/tmp/thorium/result-files/{graph_name}'
-    utils.makeByteFreqPlot(results["bytecount"], graph_path)
+    utils.makeByteFreqPlot(counts, graph_path)
     return results
 
 # the path to the sample is taken as an input
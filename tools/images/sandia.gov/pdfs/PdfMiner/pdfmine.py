@@ -1,8 +1,6 @@
 #!/usr/bin/env python3
 
-import io
 import sys
-import json
 
 from pdfminer.pdfparser import PDFParser
 from pdfminer.pdfdocument import PDFDocument
@@ -10,6 +8,29 @@ from pdfminer.pdftypes import PDFStream
 from pdfminer.pdfexceptions import PDFObjectNotFound
 from pathlib import Path
 
+# prefer orjson for faster serialization but fall back to the stdlib
+try:
+    import orjson
+
+    def dumps(obj):
+        # xref ids are ints and anything unexpected is stringified like before
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+except ImportError:
+    import json
+
+    def dumps(obj):
+        return json.dumps(obj, default=str).encode('utf-8')
+
+# get a small summary of a pdf object instead of keeping the whole object around
+def summarize_obj(obj):
+    if isinstance(obj, dict):
+        keys = list(obj.keys())
+    elif isinstance(obj, PDFStream):
+        keys = list(obj.attrs.keys())
+    else:
+        keys = None
+    return {"type": type(obj).__name__, "keys": keys}
+
 def mine_pdf(pdf_buff, children):
     # parse our pdf
     parser = PDFParser(pdf_buff)
@@ -26,8 +47,8 @@ def mine_pdf(pdf_buff, children):
                 obj = pdf.getobj(id)
             except PDFObjectNotFound:
                 print("Warning: Missing object {id}!")
-            # add this objec to our xref map
-            results["xrefs"][id] = obj
+            # add a summary of this object to our xref map
+            results["xrefs"][id] = summarize_obj(obj)
             # handle objects that are dictonaries
             if isinstance(obj, dict):
                 # check if this object has a javascript key
@@ -62,11 +83,8 @@ def mine_pdf(pdf_buff, children):
 if __name__ == "__main__":
     # try to load our file
     with open(sys.argv[1], 'rb') as fp:
-        # read ouf pdf
-        pdf_buff = io.BytesIO(fp.read())
-        # mine our pdf for javascript
-        results = mine_pdf(pdf_buff, Path("/tmp/thorium/children/carved/unknown"))
+        # mine our pdf for javascript, the parser seeks the file so it doesn't need to be read up front
+        results = mine_pdf(fp, Path("/tmp/thorium/children/carved/unknown"))
         # write our results off to disk
-        with open("/tmp/thorium/results", 'w') as fp:
-            # the default serailize is probably not production ready
-            json.dump(results, fp, default=str)
+        with open("/tmp/thorium/results", 'wb') as fp:
+            fp.write(dumps(results))
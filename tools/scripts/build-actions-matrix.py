@@ -1,31 +1,65 @@
+import hashlib
 import logging
 import json
+import os
 import tomllib
 import sys
 
+# parsed TOML manifests are cached here keyed by their content hash, JSON manifests
+# are as quick to parse as a cache would be to load so they aren't cached
+cache_dir = ".toolbox-cache"
 
 if (len(sys.argv) != 2):
     print(f"Usage: python3 {sys.argv[0]} toolbox.json")
     exit(1)
 
 manifest_path = sys.argv[1]
-toolbox_manifest = {}
+toolbox_manifest = None
 try:
-    with open(manifest_path, 'r') as manifest_file:
-        if (manifest_path.endswith(".json")):
-            toolbox_manifest = json.load(manifest_file)
-        elif (manifest_path.endswith(".toml")):
-            toolbox_manifest = tomllib.load(manifest_file)
-        logging.info(f"Loaded manifest from file {manifest_path}")
+    with open(manifest_path, 'rb') as manifest_file:
+        raw_manifest = manifest_file.read()
 except FileNotFoundError:
     logging.error(f"Failed to find manifest: {manifest_path}")
     exit(1)
-except json.JSONDecodeError as e:
-    logging.error(f"Failed to decode JSON manifest file ${manifest_path} with error {e}")
-    exit(1)
-except tomllib.TOMLDecodeError as e:
-    logging.error(f"Failed to decode TOML manifest file ${manifest_path} with error {e}")
-    exit(1)
+
+# reuse the parsed manifest from a previous run if its contents haven't changed
+cache_path = None
+if (manifest_path.endswith(".toml")):
+    manifest_hash = hashlib.blake2b(raw_manifest).hexdigest()
+    cache_path = os.path.join(cache_dir, f"toolbox-toml-{manifest_hash}.json")
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            toolbox_manifest = json.loads(cache_file.read())
+        logging.info(f"Loaded cached manifest for file {manifest_path}")
+    except Exception:
+        # the cache is only an optimization so any failure to load it is a cache miss
+        toolbox_manifest = None
+
+if not isinstance(toolbox_manifest, dict):
+    toolbox_manifest = {}
+    try:
+        if (manifest_path.endswith(".json")):
+            toolbox_manifest = json.loads(raw_manifest)
+        elif (manifest_path.endswith(".toml")):
+            toolbox_manifest = tomllib.loads(raw_manifest.decode("utf-8"))
+        logging.info(f"Loaded manifest from file {manifest_path}")
+    except json.JSONDecodeError as e:
+        logging.error(f"Failed to decode JSON manifest file ${manifest_path} with error {e}")
+        exit(1)
+    except tomllib.TOMLDecodeError as e:
+        logging.error(f"Failed to decode TOML manifest file ${manifest_path} with error {e}")
+        exit(1)
+    # the cache is only an optimization so failing to write it is not an error
+    if cache_path is not None:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            # write to a temporary file first so other runs never see a partial cache
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as cache_file:
+                json.dump(toolbox_manifest, cache_file)
+            os.replace(tmp_path, cache_path)
+        except (OSError, TypeError, ValueError) as e:
+            logging.warning(f"Failed to cache manifest at {cache_path} with error {e}")
 
 images = toolbox_manifest.get("images", None)
 if images is None:
@@ -34,16 +68,16 @@ if images is None:
 
 matrix = []
 # loop through each image name
-for image in images.keys():
-    # get each image version
-    for version in images.get(image, {}):
-        if not images[image][version].get("build_image", True):
+for versions in images.values():
+    # get each image version, binding its entry once instead of looking it up for every field
+    for image_version in versions.values():
+        if not image_version.get("build_image", True):
             continue
         # grab build path for docker context for image/version
-        build_path = images[image][version].get("build_path")
-        image_tags = images[image][version].get("image_tags", [])
+        build_path = image_version.get("build_path")
+        image_tags = image_version.get("image_tags", [])
         # grab registry image name from Thorium image config
-        config = images[image][version].get("config", {})
+        config = image_version.get("config", {})
         image_name = config.get("image", "")
         # both context build_path and registry image_name must be specified
         if (build_path != "" and image_name != ""):
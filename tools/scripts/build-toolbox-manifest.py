@@ -1,45 +1,222 @@
 import tomllib #tomllib from std only supports load/loads, toml supports dump but has awful formatting
-import json
+import contextlib
+import copy
+import hashlib
 import os
 import logging
 import argparse
+import sys
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, fields
 
-def image_fields(manifest, root, toolbox, override_path):
+# prefer orjson for faster (de)serialization but fall back to the stdlib
+try:
+    import orjson
+
+    loads = orjson.loads
+
+    def dumps(obj, sort_keys=False):
+        option = orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS if sort_keys else orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=option)
+except ImportError:
+    import json
+
+    loads = json.loads
+
+    def dumps(obj, sort_keys=False):
+        # orjson writes non-ASCII as raw UTF-8 so match it rather than escaping it
+        return json.dumps(obj, indent=2, sort_keys=sort_keys, ensure_ascii=False).encode('utf-8')
+
+# prefer the rust backed rtoml for faster TOML parsing but fall back to the stdlib
+try:
+    import rtoml
+
+    def toml_load(toml_file):
+        return rtoml.loads(toml_file.read().decode('utf-8'))
+
+    TOMLDecodeError = rtoml.TomlParsingError
+    # rtoml parses outside of python so threads can parse manifests in parallel
+    toml_parses_in_parallel = True
+except ImportError:
+    toml_load = tomllib.load
+    TOMLDecodeError = tomllib.TOMLDecodeError
+    # tomllib is pure python and holds the GIL so threads only overlap reading files
+    toml_parses_in_parallel = False
+
+# prefer a tqdm progress bar but fall back to a plain counter
+try:
+    from tqdm import tqdm
+
+    def progress(iterable, total, enabled):
+        """Report progress through an iterable on stderr if enabled"""
+        return tqdm(iterable, total=total, disable=not enabled, file=sys.stderr, unit="manifest")
+except ImportError:
+    def progress(iterable, total, enabled):
+        """Report progress through an iterable on stderr if enabled"""
+        if not enabled:
+            yield from iterable
+            return
+        count = 0
+        for item in iterable:
+            yield item
+            count += 1
+            sys.stderr.write(f"\rloaded {count}/{total} manifests")
+            sys.stderr.flush()
+        sys.stderr.write("\n")
+
+# files parsed by previous runs keyed by file identity, this is None when caching is disabled
+_parse_cache = None
+# the parsed files used by this run, only these are saved so stale entries are dropped
+_parse_cache_used = {}
+
+def file_cache_key(path):
+    """Identify a file by its absolute path, modification time and size"""
+    stat = os.stat(path)
+    identity = f"{os.path.abspath(path)}\0{stat.st_mtime_ns}\0{stat.st_size}"
+    return hashlib.sha256(identity.encode('utf-8')).hexdigest()
+
+def cache_lookup(path):
+    """Get a file's cache key and what a previous run parsed for it, parsed is None if it must be parsed again"""
+    if _parse_cache is None:
+        return None, None
+    key = file_cache_key(path)
+    return key, _parse_cache.get(key)
+
+def cached_parse(path, parse):
+    """Parse a file, reusing what a previous run parsed if the file hasn't changed since"""
+    key, parsed = cache_lookup(path)
+    if parsed is None:
+        with open(path, 'rb') as parse_file:
+            parsed = parse(parse_file)
+    if key is not None:
+        _parse_cache_used[key] = parsed
+    return parsed
+
+def load_parse_cache(cache_dir):
+    """Load the files parsed by previous runs, a cache_dir of None disables the cache"""
+    global _parse_cache, _parse_cache_used
+    _parse_cache_used = {}
+    if cache_dir is None:
+        _parse_cache = None
+        return
+    try:
+        with open(os.path.join(cache_dir, "manifest-cache.json"), 'rb') as cache_file:
+            _parse_cache = loads(cache_file.read())
+    except (OSError, ValueError):
+        # a missing or corrupt cache just means everything is parsed again
+        _parse_cache = {}
+
+def save_parse_cache(cache_dir):
+    """Save the files parsed by this run for the next run"""
+    cache_path = os.path.join(cache_dir, "manifest-cache.json")
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # write to a temporary file first so other runs never see a partial cache
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as cache_file:
+            cache_file.write(dumps(_parse_cache_used))
+        os.replace(tmp_path, cache_path)
+    except (OSError, TypeError) as e:
+        logging.warning(f"Failed to save manifest cache {cache_path} with error: {e}")
+
+# parsed config_from files keyed by absolute path, configs can be shared by many manifests
+_config_cache = {}
+
+def parse_config(config_path):
+    """Parse a config_from file, only reading and parsing each file once"""
+    cache_key = os.path.abspath(config_path)
+    config = _config_cache.get(cache_key)
+    if config is None:
+        config = cached_parse(config_path, lambda config_file: loads(config_file.read()))
+        _config_cache[cache_key] = config
+    return config
+
+def load_config(config_path):
+    """Load a config_from file for a manifest"""
+    # callers modify their config so always hand out a copy
+    return copy.deepcopy(parse_config(config_path))
+
+def config_from_path(manifest, root):
+    """Get the path to a manifest's config_from file or None if no config should be loaded"""
+    # manifests can opt out to skip loading unused configs
+    if ('config_from' in manifest and 'config' not in manifest and manifest.get("emit_config", True)):
+        return f"{root}/{manifest['config_from']}"
+    return None
+
+def prefetch_configs(config_paths, executor):
+    """Read and parse config_from files concurrently so building fields never waits on the filesystem"""
+    # each file only needs to be read once no matter how many manifests share it
+    unique_paths = {os.path.abspath(config_path): config_path for config_path in config_paths}
+    list(executor.map(parse_config, unique_paths.values()))
+
+@dataclass(slots=True)
+class ImageManifest:
+    """The fields of an image manifest used to build its toolbox entry"""
+    build_path: str
+    name: str = ""
+    image_name: str = ""
+    version: str = ""
+    build: bool = True
+    base_image_token: str | None = None
+    allow_base_override: bool = True
+
+# prefer msgspec to validate manifests in C but fall back to checking each field in python
+try:
+    import msgspec
+
+    def image_manifest(manifest):
+        """Validate an image manifest, any unused keys are ignored"""
+        return msgspec.convert(manifest, ImageManifest)
+
+    ManifestValidationError = msgspec.ValidationError
+except ImportError:
+    def image_manifest(manifest):
+        """Validate an image manifest, any unused keys are ignored"""
+        values = {}
+        for field in fields(ImageManifest):
+            if field.name in manifest:
+                value = manifest[field.name]
+                if not isinstance(value, field.type):
+                    raise TypeError(f"Expected `{getattr(field.type, '__name__', field.type)}`, got `{type(value).__name__}` - at `$.{field.name}`")
+                values[field.name] = value
+        if "build_path" not in values:
+            raise TypeError("Object missing required field `build_path`")
+        return ImageManifest(**values)
+
+    ManifestValidationError = TypeError
+
+def image_fields(manifest, root, registries, override_path):
     """Build an image's toolbox fields from an image manifest"""
     image = {}
+    # validate the manifest once so every field below has the right type and default
+    validated = image_manifest(manifest)
     # Registry image name
-    name = manifest.get("name", "")
-    image_name = manifest.get("image_name", "")
-
-    image_tags = []
-    image_version = manifest.get("version", "")
-    build_image = manifest.get("build", True)
-    base_image_token = manifest.get("base_image_token")
-    allow_base_override = manifest.get("allow_base_override", True)
+    name = validated.name
+    image_name = validated.image_name
+
+    image_version = validated.version
+    build_image = validated.build
+    base_image_token = validated.base_image_token
+    allow_base_override = validated.allow_base_override
     if (image_version == ""):
         logging.error(f" No image version found for {name}")
     if (image_name == ""):
         logging.error(f" No image name found for {name}")
+        image_tags = []
     else:
-        registries = toolbox.get("registries", [])
-        if "registry" in toolbox and toolbox.get("registry") not in registries:
-            registries.append(toolbox.get("registry"))
-        for registry in registries:
-            tag = ""
-            # use tool name rather than image name field to build container path
-            if override_path:
-                tag = f"{registry}/{name}:{image_version}"
-            # use manifest image_name field for full container path
-            else:
-                tag = f"{registry}/{image_name}:{image_version}"
-            # only add image if not duplicated by legacy "registry" key
-            if tag not in image_tags:
-                image_tags.append(tag)
+        # use tool name rather than image name field to build container path,
+        # otherwise use manifest image_name field for full container path
+        path = name if override_path else image_name
+        # everything after the registry is the same for every tag so only build it once
+        tag_suffix = f"/{path}:{image_version}"
+        # registries are already deduplicated so every tag is unique
+        image_tags = [registry + tag_suffix for registry in registries]
 
     # Container build context path
     image_build_path = f"{root}"
-    if (manifest["build_path"] not in ['./', '.']):
-        image_build_path += f"/{manifest["build_path"]}"
+    if (validated.build_path not in ['./', '.']):
+        image_build_path += f"/{validated.build_path}"
     image["build_path"] = image_build_path
     image["build_image"] = build_image
     image["image_tags"] = image_tags
@@ -47,15 +224,14 @@ def image_fields(manifest, root, toolbox, override_path):
     if base_image_token:
         image["base_image_token"] = base_image_token
     # Thorium image configuration
-    if ('config_from' in manifest and 'config' not in manifest):
-        config_path = f"{root}/{manifest['config_from']}"
-        with open(config_path, 'rb') as config_file:
-            config = json.load(config_file)
-            if len(image_tags) == 0:
-                logging.error(f"No image tag specified, leaving {name} image config blank")
-            else:
-                config["image"] = image_tags[0]
-            image["config"] = config
+    config_path = config_from_path(manifest, root)
+    if config_path is not None:
+        config = load_config(config_path)
+        if len(image_tags) == 0:
+            logging.error(f"No image tag specified, leaving {name} image config blank")
+        else:
+            config["image"] = image_tags[0]
+        image["config"] = config
     return image
 
 def pipeline_fields(manifest, root):
@@ -63,15 +239,102 @@ def pipeline_fields(manifest, root):
     pipeline = {}
     pipeline["description"] = manifest.get("description", "")
     pipeline["images"] = manifest.get("images", {})
-    if ('config_from' in manifest and 'config' not in manifest):
-        config_path = f"{root}/{manifest['config_from']}"
-        with open(config_path, 'rb') as config_file:
-            config = json.load(config_file)
-            pipeline["config"] = config
+    config_path = config_from_path(manifest, root)
+    if config_path is not None:
+        pipeline["config"] = load_config(config_path)
     return pipeline
 
-def main():
-    """Build a toolbox manifest from a project containing images and pipelines"""
+# directories that never contain manifests and aren't worth walking, hidden directories are always skipped
+default_ignored_dirs = frozenset({"node_modules", "__pycache__"})
+
+# a file with this name skips the directory it is in along with everything below it
+ignore_marker = ".toolboxignore"
+
+def find_manifests(top, ignored_dirs=default_ignored_dirs):
+    """Find all manifests below a directory in the same top-down order as os.walk"""
+    stack = [top]
+    while stack:
+        directory = stack.pop()
+        # manifests in the top directory are ignored so only check for them below it
+        find_manifest = directory != top
+        subdirs = []
+        manifest_path = None
+        ignored = False
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                name = entry.name
+                # the entry type comes from the directory listing so this doesn't stat
+                if entry.is_dir(follow_symlinks=False):
+                    # skip hidden directories like .git along with any other ignored directories
+                    if not name.startswith(".") and name not in ignored_dirs:
+                        subdirs.append(entry.path)
+                elif name == ignore_marker:
+                    ignored = True
+                    break
+                elif find_manifest and name == 'manifest.toml':
+                    manifest_path = entry.path
+        # the marker can come after anything else in the listing so only use it once the listing is done
+        if ignored:
+            continue
+        if manifest_path is not None:
+            yield manifest_path, directory
+        # push subdirectories in reverse so they are walked in listing order
+        stack.extend(reversed(subdirs))
+
+def load_manifest(manifest_path):
+    """Read in a TOML formatted manifest file"""
+    return cached_parse(manifest_path, toml_load)
+
+def parse_manifest(manifest_path):
+    """Read in a TOML formatted manifest file without the cache so it can run in another process"""
+    with open(manifest_path, 'rb') as manifest_file:
+        return toml_load(manifest_file)
+
+# parsing fewer manifests than this in worker processes costs more to start the processes than it saves
+process_parse_threshold = 200
+
+def load_manifests(manifest_paths, executor, show_progress=False):
+    """Read and parse manifests concurrently, keeping them in the given order"""
+    total = len(manifest_paths)
+    if toml_parses_in_parallel:
+        # map yields each manifest as soon as it and the ones before it are parsed
+        return list(progress(executor.map(load_manifest, manifest_paths), total, show_progress))
+    # check the cache first so only manifests that changed need parsing
+    lookups = list(executor.map(cache_lookup, manifest_paths))
+    missing = [manifest_path for manifest_path, (_, parsed) in zip(manifest_paths, lookups) if parsed is None]
+    # threads can't parse in parallel with tomllib so spread large parses across processes
+    use_processes = len(missing) >= process_parse_threshold
+    with (ProcessPoolExecutor() if use_processes else contextlib.nullcontext(executor)) as parse_executor:
+        parsed_missing = parse_executor.map(parse_manifest, missing, chunksize=16)
+        manifests = []
+        for key, parsed in progress(lookups, total, show_progress):
+            if parsed is None:
+                parsed = next(parsed_missing)
+            if key is not None:
+                _parse_cache_used[key] = parsed
+            manifests.append(parsed)
+    return manifests
+
+def write_streamed(out, value, indent=b"", levels=2, sort_keys=False):
+    """
+    Write a value as indented JSON, writing the given number of dict levels entry by entry
+    so only one entry is ever serialized in memory at a time
+    """
+    if levels == 0 or not isinstance(value, dict) or not value:
+        # JSON strings can't hold raw newlines so every newline is safe to indent
+        out.write(dumps(value, sort_keys).replace(b"\n", b"\n" + indent))
+        return
+    inner = indent + b"  "
+    separator = b"{\n"
+    items = sorted(value.items(), key=lambda item: item[0]) if sort_keys else value.items()
+    for key, member in items:
+        out.write(separator + inner + dumps(key) + b": ")
+        write_streamed(out, member, inner, levels - 1, sort_keys)
+        separator = b",\n"
+    out.write(b"\n" + indent + b"}")
+
+def parse_args(argv=None):
+    """Parse the command line arguments"""
     argparser = argparse.ArgumentParser()
     argparser.add_argument("-c", "--config",
         help="Toolbox config (JSON/TOML)",
@@ -82,6 +345,47 @@ def main():
         help="Use manifest image_name instead of tool name in container tag",
         action='store_true',
         )
+    argparser.add_argument("--ignore-dir",
+        help="Name of a directory to skip when looking for manifests, can be repeated",
+        action='append',
+        default=[],
+        )
+    argparser.add_argument("--cache-dir",
+        help="Directory to cache parsed manifests and configs in between runs (default: .toolbox-cache)",
+        type=str,
+        default=".toolbox-cache",
+        )
+    argparser.add_argument("--sorted",
+        help="Sort the keys of toolbox.json so the output doesn't depend on walk order",
+        action='store_true',
+        )
+    argparser.add_argument("--progress",
+        help="Show how many manifests have been loaded on stderr",
+        action='store_true',
+        )
+    argparser.add_argument("--no-cache",
+        help="Parse every manifest and config without reading or writing the cache",
+        action='store_true',
+        )
+    return argparser.parse_args(argv)
+
+# parsed toolbox configs keyed by absolute path so repeated builds don't reread them
+_toolbox_config_cache = {}
+
+def load_toolbox_config(toolbox_config_path):
+    """Load a toolbox config, only reading and parsing each config once"""
+    cache_key = os.path.abspath(toolbox_config_path)
+    config = _toolbox_config_cache.get(cache_key)
+    if config is None:
+        with open(toolbox_config_path, 'rb') as config_file:
+            config = toml_load(config_file)
+        _toolbox_config_cache[cache_key] = config
+    return config
+
+def main(argv=None):
+    """Build a toolbox manifest from a project containing images and pipelines"""
+    args = parse_args(argv)
+    toolbox_config_path = args.config
     # create empty market place manifest
     toolbox = {
         "pipelines": {},
@@ -89,58 +393,71 @@ def main():
     }
     try:
         # load toolbox manifest file
-        args = argparser.parse_args() 
-        toolbox_config_path = args.config
-        with open(toolbox_config_path, 'rb') as config_file:
-            config = tomllib.load(config_file)
-        toolbox["name"] = config.get("name", "")
-        toolbox["registry"] = config.get("registry", "")
-        toolbox["registries"] = config.get("registries", [])
-        image_path_prefix = config.get("override_image_path_prefix", "")
-
+        config = load_toolbox_config(toolbox_config_path)
     except FileNotFoundError:
         logging.error(f"Failed to find toolbox manifest {toolbox_config_path}")
         exit(1)
-    except tomllib.TOMLDecodeError as e:
+    except TOMLDecodeError as e:
         logging.error(f"Failed to decode TOML toolbox config ${toolbox_config_path} with error: {e}")
         exit(1)
     except Exception as e:
         logging.error(f"Failed to load toolbox config with unexpected error: {e}")
         exit(1) 
+
+    toolbox["name"] = config.get("name", "")
+    toolbox["registry"] = config.get("registry", "")
+    toolbox["registries"] = config.get("registries", [])
+    image_path_prefix = config.get("override_image_path_prefix", "")
+    # merge the legacy "registry" key into registries once rather than for every image
+    legacy_registry = [toolbox["registry"]] if toolbox["registry"] else []
+    registries = tuple(dict.fromkeys([*toolbox["registries"], *legacy_registry]))
+    toolbox["registries"] = list(registries)
     
-    images = dict()
-    pipelines = dict()
+    # reuse the manifests and configs parsed by previous runs if they haven't changed
+    cache_dir = None if args.no_cache else args.cache_dir
+    load_parse_cache(cache_dir)
+
+    images = defaultdict(dict)
+    pipelines = defaultdict(dict)
+    # bind anything used for every manifest once before the loop
+    override_path = args.override_path
     # loop through any directories looking for manifests
-    for root, _, files in os.walk('.'):
-        for file in files:
-            if (file == 'manifest.toml' and root != '.'):
-                manifest_path = os.path.join(root, file)
-                with open(manifest_path, 'rb') as manifest_file:
-                    # read in the TOML formatted manifest file
-                    manifest = tomllib.load(manifest_file)
-                    # import this pipeline to the toolbox manifest
-                    if manifest["type"] == "pipeline":
-                        name = manifest["name"] # name of Thorium pipeline
-                        version = manifest.get('version', "latest") # version or if not present latest
-                        if (name not in pipelines):
-                            pipelines[name] = {}
-                        # populate pipeline manifest fields
-                        pipelines[name][version] = pipeline_fields(manifest, root)
-                    # import this image to the toolbox manifest
-                    if manifest["type"] == "image":
-                        name = manifest["name"] # name of Thorium image
-                        version = manifest.get('version', "latest") # version or if not present latest
-                        if (name not in images):
-                            images[name] = {}
-                        # populate image manifest fields
-                        images[name][version] = image_fields(manifest, root, toolbox, args.override_path)
+    found = list(find_manifests('.', default_ignored_dirs.union(args.ignore_dir)))
+    # manifests are independent so read and parse them concurrently, map keeps them in walk order
+    with ThreadPoolExecutor(max_workers=os.cpu_count() * 2) as executor:
+        manifests = load_manifests([manifest_path for manifest_path, _ in found], executor, args.progress)
+        # read every config the manifests need up front in one concurrent batch
+        config_paths = (config_from_path(manifest, root) for (_, root), manifest in zip(found, manifests))
+        prefetch_configs([config_path for config_path in config_paths if config_path is not None], executor)
+        for (manifest_path, root), manifest in zip(found, manifests):
+            # import this pipeline to the toolbox manifest
+            if manifest["type"] == "pipeline":
+                name = manifest["name"] # name of Thorium pipeline
+                version = manifest.get('version', "latest") # version or if not present latest
+                # populate pipeline manifest fields
+                pipelines[name][version] = pipeline_fields(manifest, root)
+            # import this image to the toolbox manifest
+            if manifest["type"] == "image":
+                name = manifest["name"] # name of Thorium image
+                version = manifest.get('version', "latest") # version or if not present latest
+                # populate image manifest fields
+                try:
+                    images[name][version] = image_fields(manifest, root, registries, override_path)
+                except ManifestValidationError as e:
+                    logging.error(f"Invalid image manifest {manifest_path} with error: {e}")
+                    exit(1)
     
     # Add Pipelines and Images to the market manifest          
-    toolbox["pipelines"] = pipelines
-    toolbox["images"] = images
+    toolbox["pipelines"] = dict(pipelines)
+    toolbox["images"] = dict(images)
     
-    with open('toolbox.json', 'w') as toolbox_json_file:
-        json.dump(toolbox, toolbox_json_file, indent=2)
+    # write each image and pipeline out on its own instead of serializing the whole toolbox at once
+    with open('toolbox.json', 'wb') as toolbox_json_file:
+        write_streamed(toolbox_json_file, toolbox, sort_keys=args.sorted)
+        # end the file with a newline like any other text file
+        toolbox_json_file.write(b"\n")
+    if cache_dir is not None:
+        save_parse_cache(cache_dir)
     # toml dumping looks really bad here, keys are dumped level by level so different images configs are interspersed
     #with open('toolbox.toml', 'w') as toolbox_toml_file:
     #    toml.dump(toolbox_manifest, toolbox_toml_file)